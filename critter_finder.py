@@ -1,32 +1,61 @@
+import functools
+import io
 import itertools
-import os
+import numpy as np
+import orjson
 import pandas as pd
 import re
 import requests
 import sys
 import threading
-import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
 from matplotlib import colors as mcolors
 import matplotlib.pyplot as plt
+from matplotlib.collections import PathCollection
 from matplotlib.offsetbox import AnnotationBbox, OffsetImage
 from matplotlib.patches import Rectangle
+from matplotlib.path import Path
 from mpl_toolkits.basemap import Basemap
 from PIL import Image
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 
-done = False
+done = threading.Event()
+
+_ZIP_RE = re.compile(r"\b\d{5}(?:[-\s]?\d{4})?\b")
+
+MAX_WORKERS = 16
+
+IMAGE_CHUNK_SIZE = 128 * 1024
+
+NOAA_TOKEN_PLACEHOLDER = "replace_with_noaa_api_key"
+NOAA_TOKEN = NOAA_TOKEN_PLACEHOLDER
+
+_SESSION = requests.Session()
+_SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=32,
+        pool_maxsize=32,
+        max_retries=Retry(
+            total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504]
+        ),
+    ),
+)
 
 
 def animate():
     """Displays a loading spinner in the console."""
+    if not sys.stdout.isatty():
+        return
     for c in itertools.cycle(["|", "/", "-", "\\"]):
-        if done:
-            break
         sys.stdout.write(f"\rloading {c}")
         sys.stdout.flush()
-        time.sleep(0.1)
+        if done.wait(0.25):
+            break
     sys.stdout.write("\rDone!          \n")
 
 
@@ -43,22 +72,25 @@ def get_inaturalist_observations(taxon_id, per_page):
     }
 
     try:
-        response = requests.get(url, params=params)
+        response = _SESSION.get(url, params=params)
         response.raise_for_status()
-        observation_response = response.json()["results"]
+        observation_response = orjson.loads(response.content)["results"]
+        cutoff = datetime.today() - relativedelta(days=2)
 
         for observation in observation_response:
             observation_id = observation["id"]
             observation_datetime = observation["time_observed_at"]
+            if not observation_datetime:
+                continue
 
-            if observation_datetime and datetime.fromisoformat(
-                observation_datetime
-            ).replace(tzinfo=None) < datetime.today() - relativedelta(days=2):
+            dt = datetime.fromisoformat(observation_datetime)
+            if dt.replace(tzinfo=None) < cutoff:
                 place_guess = observation.get("place_guess", "")
-                zip_code_match = re.search(r"\b\d{5}(?:[-\s]?\d{4})?\b", place_guess)
+                zip_code_match = _ZIP_RE.search(place_guess)
                 if zip_code_match:
                     observation_data = {
-                        "datetime": observation["time_observed_at"],
+                        "datetime": dt,
+                        "date": dt.date().isoformat(),
                         "species": observation["species_guess"],
                         "zip_code": zip_code_match.group(),
                         "coordinates": observation["location"],
@@ -67,37 +99,58 @@ def get_inaturalist_observations(taxon_id, per_page):
                         ],
                     }
                     observations[observation_id] = observation_data
-    except requests.RequestException as e:
+    except (requests.RequestException, orjson.JSONDecodeError) as e:
         print(f"Error fetching iNaturalist data: {e}")
     return observations
 
 
 def download_image(photo_url, obs_id):
-    """Download image for the observation and save locally."""
+    """Download image for the observation and return its raw bytes."""
     try:
-        response = requests.get(photo_url, stream=True)
+        response = _SESSION.get(
+            photo_url, headers={"Accept-Encoding": "identity"}, stream=True
+        )
         response.raise_for_status()
-
-        img_path = f"{obs_id}.jpg"
-        with open(img_path, "wb") as img_file:
-            for chunk in response.iter_content(1024):
-                img_file.write(chunk)
-        return img_path
+        return b"".join(response.iter_content(IMAGE_CHUNK_SIZE))
     except requests.RequestException as e:
         print(f"Error downloading image for observation {obs_id}: {e}")
     return None
 
 
+@functools.lru_cache(maxsize=16)
+def get_basemap(llcrnrlat, urcrnrlat, llcrnrlon, urcrnrlon):
+    """Build (and cache) the Basemap for a bounding box."""
+    return Basemap(
+        projection="merc",
+        llcrnrlat=llcrnrlat,
+        urcrnrlat=urcrnrlat,
+        llcrnrlon=llcrnrlon,
+        urcrnrlon=urcrnrlon,
+        resolution="i",
+    )
+
+
 def plot_observations_on_map(observations):
     """Plot observations on a map with a compact legend."""
     fig, ax = plt.subplots(figsize=(12, 10))
 
-    lats = [float(obs["coordinates"].split(",")[0]) for obs in observations.values()]
-    lons = [float(obs["coordinates"].split(",")[1]) for obs in observations.values()]
+    df = pd.DataFrame.from_dict(observations, orient="index")
+    coords = np.fromiter(
+        (
+            float(value)
+            for coordinates in df["coordinates"]
+            for value in coordinates.split(",")
+        ),
+        dtype=np.float64,
+        count=2 * len(df),
+    ).reshape(-1, 2)
+    df["lat"] = coords[:, 0]
+    df["lon"] = coords[:, 1]
 
     padding_factor = 0.25
-    min_lat, max_lat = min(lats), max(lats)
-    min_lon, max_lon = min(lons), max(lons)
+    bounds = df[["lat", "lon"]].agg(["min", "max"])
+    min_lat, max_lat = bounds["lat"]
+    min_lon, max_lon = bounds["lon"]
 
     lat_diff = max_lat - min_lat or 0.1
     lon_diff = max_lon - min_lon or 0.1
@@ -107,48 +160,76 @@ def plot_observations_on_map(observations):
     llcrnrlon = min_lon - lon_diff * padding_factor * 4
     urcrnrlon = max_lon + lon_diff * padding_factor * 4
 
-    m = Basemap(
-        projection="merc",
-        llcrnrlat=llcrnrlat,
-        urcrnrlat=urcrnrlat,
-        llcrnrlon=llcrnrlon,
-        urcrnrlon=urcrnrlon,
-        resolution="i",
-        ax=ax,
-    )
+    m = get_basemap(llcrnrlat, urcrnrlat, llcrnrlon, urcrnrlon)
 
-    m.drawcoastlines()
-    m.drawstates()
-    m.drawcountries()
-    m.fillcontinents(color="lightgreen", lake_color="lightblue")
-    m.drawmapboundary(fill_color="lightblue")
-    m.drawrivers(color="blue")
+    m.drawcoastlines(ax=ax)
+    m.drawstates(ax=ax)
+    m.drawcountries(ax=ax)
+    m.fillcontinents(color="lightgreen", lake_color="lightblue", ax=ax)
+    m.drawmapboundary(fill_color="lightblue", ax=ax)
+    m.drawrivers(color="blue", ax=ax)
 
     species_names = list(set(obs["species"] for obs in observations.values()))
     color_map = {
         species: color for species, color in zip(species_names, mcolors.TABLEAU_COLORS)
     }
 
-    for obs_id, obs in observations.items():
-        lat, lon = map(float, obs["coordinates"].split(","))
-        x, y = m(lon, lat)
-
-        img_path = download_image(obs["photo_url"], obs_id)
-        if img_path:
-            img = Image.open(img_path)
-            img.thumbnail((50, 50), Image.Resampling.LANCZOS)
-
-            border_color = color_map[obs["species"]]
-            imbox = OffsetImage(img, zoom=0.5)
-            ab = AnnotationBbox(
-                imbox,
-                (x, y),
-                frameon=True,
-                bboxprops=dict(edgecolor=border_color, linewidth=4),
+    xs, ys = m(df["lon"].to_numpy(), df["lat"].to_numpy())
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {
+            executor.submit(download_image, photo_url, obs_id): (x, y, species)
+            for obs_id, photo_url, species, x, y in zip(
+                df.index, df["photo_url"], df["species"], xs, ys
             )
+        }
+
+        # Frames are sized in points: OffsetImage draws one pixel per point
+        # times zoom, and AnnotationBbox's default frame pad is 4pt.
+        zoom, pad = 0.5, 4
+        border_paths, border_offsets, border_colors = [], [], []
+        for future in futures:
+            x, y, species = futures[future]
+            img_data = future.result()
+            if not img_data:
+                continue
+
+            img = Image.open(io.BytesIO(img_data))
+            img.thumbnail((50, 50), Image.Resampling.BILINEAR)
+
+            imbox = OffsetImage(img, zoom=zoom)
+            ab = AnnotationBbox(imbox, (x, y), frameon=False)
             ax.add_artist(ab)
 
-            os.remove(img_path)
+            half_w = img.size[0] * zoom / 2 + pad
+            half_h = img.size[1] * zoom / 2 + pad
+            border_paths.append(
+                Path(
+                    [
+                        (-half_w, -half_h),
+                        (half_w, -half_h),
+                        (half_w, half_h),
+                        (-half_w, half_h),
+                        (-half_w, -half_h),
+                    ],
+                    closed=True,
+                )
+            )
+            border_offsets.append((x, y))
+            border_colors.append(color_map[species])
+
+    if border_paths:
+        borders = PathCollection(
+            border_paths,
+            sizes=[1],
+            offsets=border_offsets,
+            offset_transform=ax.transData,
+            facecolors="none",
+            edgecolors=border_colors,
+            linewidths=4,
+            zorder=2,
+        )
+        ax.add_collection(borders, autolim=False)
 
     num_species = len(color_map)
     legend_box_height = num_species * 0.1
@@ -178,57 +259,61 @@ def plot_observations_on_map(observations):
 
 def plot_weather_data(observations, ax):
     """Plot weather data for each species."""
-    observations = {k: v for k, v in observations.items() if v["species"]}
-
-    species_weather = {}
-    for obs_id, obs in observations.items():
-        species = obs["species"]
-        weather = obs.get("weather")
-        if weather:
-            avg_temp = weather.get("avg_temp", 0)
-            rain = weather.get("rain", 0)
-            species_weather.setdefault(species, {"avg_temp": [], "rain": []})
-            species_weather[species]["avg_temp"].append(avg_temp)
-            species_weather[species]["rain"].append(rain)
-
-    species_weather = {
-        species: data
-        for species, data in species_weather.items()
-        if species and data["avg_temp"] and data["rain"]
-    }
-
-    aggregated_data = [
+    rows = [
+        (obs["species"], obs["weather"]["avg_temp"], obs["weather"]["rain"])
+        for obs in observations.values()
+        if obs["species"] and obs.get("weather")
+    ]
+    species, temps, rains = zip(*rows) if rows else ((), (), ())
+    df = pd.DataFrame(
         {
-            "species": species,
-            "avg_temp": int(sum(data["avg_temp"]) / len(data["avg_temp"])),
-            "rain": sum(data["rain"]),
+            "species": np.asarray(species, dtype=object),
+            "avg_temp": np.asarray(temps, dtype="float64"),
+            "rain": np.asarray(rains, dtype="float64"),
         }
-        for species, data in species_weather.items()
-    ]
+    ).dropna()
 
-    df_weather = pd.DataFrame(aggregated_data).dropna(subset=["avg_temp", "rain"])
+    df_weather = df.groupby("species", as_index=False).agg(
+        avg_temp=("avg_temp", "mean"), rain=("rain", "sum")
+    )
+    df_weather["avg_temp"] = df_weather["avg_temp"].astype(int)
     print(df_weather)
 
+    species = df_weather["species"].to_numpy()
+    avg_temp = df_weather["avg_temp"].to_numpy()
+    rain = df_weather["rain"].to_numpy()
+    ticks = range(len(species))
+
     fig, (ax_temp, ax_precip) = plt.subplots(2, 1, figsize=(10, 8))
 
-    ax_temp.bar(df_weather["species"], df_weather["avg_temp"], color="skyblue")
+    ax_temp.bar(ticks, avg_temp, color="skyblue")
     ax_temp.set_title("Average Temperature", fontsize=10)
     ax_temp.set_ylabel("Temperature (°F)", fontsize=8)
-    ax_temp.set_xticks(range(len(df_weather)))
-    ax_temp.set_xticklabels(df_weather["species"], rotation=45, ha="right")
+    ax_temp.set_xticks(ticks, labels=species, rotation=45, ha="right")
 
-    ax_precip.bar(df_weather["species"], df_weather["rain"], color="lightgreen")
+    ax_precip.bar(ticks, rain, color="lightgreen")
     ax_precip.set_title("Total Precipitation", fontsize=10)
     ax_precip.set_ylabel("Precipitation (inches)", fontsize=8)
-    ax_precip.set_xticks(range(len(df_weather)))
-    ax_precip.set_xticklabels(df_weather["species"], rotation=45, ha="right")
+    ax_precip.set_xticks(ticks, labels=species, rotation=45, ha="right")
 
     plt.tight_layout()
     plt.show()
 
 
-def get_weather_for_observation(zip_code, date, token):
-    """Fetch historical weather data for an observation."""
+def noaa_token_is_rejected(token):
+    """Probe NOAA once; only an explicit auth/client error counts as rejection."""
+    url = "https://www.ncei.noaa.gov/cdo-web/api/v2/datasets"
+    try:
+        response = _SESSION.get(url, headers={"token": token}, params={"limit": 1})
+        return response.status_code in (400, 401, 403)
+    except requests.RequestException as e:
+        print(f"Error checking NOAA token: {e}")
+    return False
+
+
+@functools.lru_cache(maxsize=4096)
+def _fetch_weather(zip_code, date, token):
+    """Fetch and parse NOAA weather; raises on failure so errors aren't cached."""
     url = "https://www.ncei.noaa.gov/cdo-web/api/v2/data"
     headers = {"token": token}
     params = {
@@ -241,25 +326,34 @@ def get_weather_for_observation(zip_code, date, token):
         "location": zip_code,
     }
 
-    try:
-        response = requests.get(url, headers=headers, params=params)
-        response.raise_for_status()
+    response = _SESSION.get(url, headers=headers, params=params)
+    response.raise_for_status()
 
-        data = response.json()
-        weather = {"avg_temp": None, "rain": None}
-        for record in data["results"]:
-            if record["datatype"] == "TAVG":
-                weather["avg_temp"] = record["value"]
-            elif record["datatype"] == "PRCP":
-                weather["rain"] = record["value"]
-        return weather
-    except requests.RequestException as e:
+    data = orjson.loads(response.content)
+    weather = {"avg_temp": None, "rain": None}
+    for record in data["results"]:
+        if record["datatype"] == "TAVG":
+            weather["avg_temp"] = record["value"]
+        elif record["datatype"] == "PRCP":
+            weather["rain"] = record["value"]
+    return weather
+
+
+def get_weather_for_observation(zip_code, date, token):
+    """Fetch historical weather data for an observation."""
+    try:
+        return _fetch_weather(zip_code, date, token)
+    except (requests.RequestException, orjson.JSONDecodeError) as e:
         print(f"Error fetching NOAA data: {e}")
     return None
 
 
 def main():
-    token = "replace_with_noaa_api_key"
+    token = NOAA_TOKEN
+    skip_weather = token == NOAA_TOKEN_PLACEHOLDER
+    if skip_weather:
+        print("NOAA token not set; skipping weather.")
+
     try:
         taxon_id = int(input("What is the ID of the taxon you would like to find?\t"))
         num_of_results = int(input("How many do you want to search through?\t\t\t"))
@@ -275,17 +369,34 @@ def main():
         print("No observations found.")
         return
 
-    for observation in observations.values():
-        observation["weather"] = get_weather_for_observation(
-            observation["zip_code"], observation["datetime"].split("T")[0], token
-        )
+    token_rejected = not skip_weather and noaa_token_is_rejected(token)
+    skip_weather = skip_weather or token_rejected
+
+    if not skip_weather:
+        weather_keys = {
+            obs_id: (observation["zip_code"], observation["date"])
+            for obs_id, observation in observations.items()
+        }
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            futures = {
+                key: executor.submit(get_weather_for_observation, *key, token)
+                for key in set(weather_keys.values())
+            }
+            weather_by_key = {key: future.result() for key, future in futures.items()}
+
+        for obs_id, observation in observations.items():
+            observation["weather"] = weather_by_key[weather_keys[obs_id]]
 
-    global done
-    done = True
+    done.set()
     t.join()
+    if token_rejected:
+        print("NOAA token rejected; skipping weather.")
 
     fig, ax = plot_observations_on_map(observations)
-    plot_weather_data(observations, ax)
+    if skip_weather:
+        plt.show()
+    else:
+        plot_weather_data(observations, ax)
 
 
 if __name__ == "__main__":